@@ -0,0 +1,467 @@
+# =====================================
+# teste_carga.py – Teste de carga do Painel IQE
+# =====================================
+"""Simula N sessões simultâneas do painel e mede a latência dos reruns.
+
+Sobe ``app_ICMS_Educacional_ES.py`` com ``streamlit run`` em modo headless e
+conecta cada sessão simulada pelo mesmo WebSocket (``/_stcore/stream``) usado
+pelo navegador. Cada sessão segue um roteiro de uso realista: abre o painel
+IQE, escolhe um município, alterna o ``radar_tipo``, ajusta os sliders do
+simulador e troca de município novamente.
+
+A troca de abas (``st.tabs``) acontece só no navegador e não dispara rerun no
+servidor; no roteiro ela entra apenas como tempo de leitura do usuário.
+
+Para cada quantidade de sessões o script registra p50/p95/p99 da latência de
+rerun, vazão, CPU e RSS do processo do servidor, e grava em ``--saida``:
+
+* ``capacidade.csv`` – uma linha por quantidade de sessões;
+* ``latencias.csv`` – todas as medições brutas (sessões, ação, latência);
+* ``curva_capacidade.html`` – gráfico Plotly da curva de capacidade;
+* ``servidor.log`` – saída do ``streamlit run``, para diagnosticar falhas.
+
+Exceções do app (que o Streamlit mostra na página e não interrompem o rerun)
+contam como erro, não como amostra de latência.
+
+Uso::
+
+    python tools/teste_carga.py --sessoes 1,2,4,8,16 --duracao 60
+    python tools/teste_carga.py --sessoes 1,8 --duracao 30 --limite-p95 2000
+
+Com ``--limite-p95`` o script termina com código 1 se o p95 de alguma etapa
+ultrapassar o limite (em ms), o que permite usá-lo para pegar regressões.
+Mesmo sem ``--limite-p95``, o código de saída é 1 se alguma etapa registrar
+erros (exceções do app ou sessões que caíram).
+
+Os arquivos de resultado são regravados ao fim de cada etapa; se a execução
+for interrompida, as etapas já concluídas ficam salvas.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import tornado.websocket
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+try:
+    import psutil
+except ImportError:  # psutil é opcional; sem ele, lemos /proc (Linux)
+    psutil = None
+
+RAIZ = Path(__file__).resolve().parent.parent
+APP_PADRAO = RAIZ / "app_ICMS_Educacional_ES.py"
+
+# Rótulos dos widgets do app usados no roteiro
+LABEL_MENU = "Escolha a seção:"
+LABEL_MUNICIPIO = "Selecione o município:"
+LABEL_RADAR = "O que você quer ver no radar?"
+LABELS_SLIDERS = ["IQEF (70%)", "P (15%)", "IMEG (15%)"]
+OPCAO_MENU_IQE = "📊 IQE"
+
+# Tamanho máximo de mensagem igual ao padrão do servidor (server.maxMessageSize)
+TAMANHO_MAX_MENSAGEM = 200 * 1024 * 1024
+
+
+class ErroApp(Exception):
+    """O script do app levantou uma exceção durante o rerun."""
+
+
+# ============================
+# SERVIDOR STREAMLIT
+# ============================
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(app, porta, log, timeout=60):
+    app = Path(app).resolve()
+    cmd = [
+        sys.executable, "-m", "streamlit", "run", str(app),
+        "--server.headless", "true",
+        "--server.port", str(porta),
+        "--server.address", "127.0.0.1",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ]
+    # O app lê a planilha por caminho relativo, então roda a partir da pasta do app
+    proc = subprocess.Popen(cmd, cwd=app.parent, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{porta}/_stcore/health"
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proc.poll() is not None:
+            raise RuntimeError(f"streamlit encerrou com código {proc.returncode}"
+                               f" (veja {log.name})")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError(f"servidor não respondeu em {timeout}s (veja {log.name})")
+
+
+class MonitorProcesso:
+    """Amostra CPU (%) e RSS (bytes) de um processo em segundo plano."""
+
+    def __init__(self, pid, intervalo=0.5):
+        self.pid = pid
+        self.intervalo = intervalo
+        self.amostras = []
+        self._tarefa = None
+        self._proc = psutil.Process(pid) if psutil else None
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def _cpu_segundos(self):
+        if self._proc:
+            t = self._proc.cpu_times()
+            return t.user + t.system
+        try:
+            campos = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+            return (int(campos[11]) + int(campos[12])) / self._ticks
+        except OSError:
+            return np.nan
+
+    def rss(self):
+        if self._proc:
+            return self._proc.memory_info().rss
+        try:
+            for linha in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) * 1024
+        except OSError:
+            pass
+        return np.nan
+
+    async def _loop(self):
+        cpu_ant, t_ant = self._cpu_segundos(), time.monotonic()
+        while True:
+            await asyncio.sleep(self.intervalo)
+            cpu, t = self._cpu_segundos(), time.monotonic()
+            self.amostras.append((100 * (cpu - cpu_ant) / (t - t_ant), self.rss()))
+            cpu_ant, t_ant = cpu, t
+
+    def iniciar(self):
+        self.amostras = []
+        self._tarefa = asyncio.ensure_future(self._loop())
+
+    async def parar(self):
+        self._tarefa.cancel()
+        try:
+            await self._tarefa
+        except asyncio.CancelledError:
+            pass
+        if not self.amostras:
+            return np.nan, np.nan
+        cpu, rss = zip(*self.amostras)
+        return float(np.nanmean(cpu)), float(np.nanmax(rss))
+
+
+# ============================
+# SESSÃO SIMULADA
+# ============================
+class SessaoSimulada:
+    """Um "navegador" falando o protocolo do Streamlit pelo WebSocket."""
+
+    def __init__(self, url):
+        self.url = url
+        self.conn = None
+        self.widgets = {}   # label -> proto do elemento (radio, selectbox, slider)
+        self.estado = {}    # id do widget -> WidgetState enviado ao servidor
+
+    async def conectar(self):
+        self.conn = await tornado.websocket.websocket_connect(
+            self.url, max_message_size=TAMANHO_MAX_MENSAGEM
+        )
+
+    def fechar(self):
+        if self.conn is not None:
+            self.conn.close()
+
+    def _registrar_widget(self, elemento):
+        tipo = elemento.WhichOneof("type")
+        if tipo not in ("radio", "selectbox", "slider"):
+            return
+        proto = getattr(elemento, tipo)
+        self.widgets[proto.label] = proto
+        if proto.id in self.estado:
+            return
+        ws = WidgetState(id=proto.id)
+        if tipo == "slider":
+            ws.double_array_value.data[:] = list(proto.default)
+        else:
+            ws.int_value = proto.default
+        self.estado[proto.id] = ws
+
+    async def rerun(self):
+        """Envia um rerun com o estado atual dos widgets e espera o fim do script.
+
+        Levanta ``ErroApp`` se o app exibiu uma exceção durante o rerun.
+        """
+        msg = BackMsg()
+        msg.rerun_script.widget_states.widgets.extend(self.estado.values())
+        inicio = time.perf_counter()
+        await self.conn.write_message(msg.SerializeToString(), binary=True)
+        excecao = None
+        while True:
+            dados = await self.conn.read_message()
+            if dados is None:
+                raise ConnectionError("WebSocket fechado pelo servidor")
+            fwd = ForwardMsg()
+            fwd.ParseFromString(dados)
+            tipo = fwd.WhichOneof("type")
+            if tipo == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                elemento = fwd.delta.new_element
+                if elemento.WhichOneof("type") == "exception" and excecao is None:
+                    excecao = f"{elemento.exception.type}: {elemento.exception.message}"
+                self._registrar_widget(elemento)
+            elif tipo == "script_finished":
+                if fwd.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if fwd.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("script terminou com erro de compilação")
+                if excecao is not None:
+                    raise ErroApp(excecao)
+                return time.perf_counter() - inicio
+
+    def escolher_opcao(self, label, opcao=None, rng=random):
+        """Seleciona uma opção de radio/selectbox (aleatória se ``opcao`` for None)."""
+        proto = self.widgets[label]
+        opcoes = list(proto.options)
+        indice = opcoes.index(opcao) if opcao is not None else rng.randrange(len(opcoes))
+        self.estado[proto.id].int_value = indice
+
+    def alternar_opcao(self, label):
+        proto = self.widgets[label]
+        ws = self.estado[proto.id]
+        ws.int_value = (ws.int_value + 1) % len(proto.options)
+
+    def mover_slider(self, label, rng=random):
+        proto = self.widgets[label]
+        passos = int(round((proto.max - proto.min) / proto.step))
+        valor = proto.min + rng.randint(0, passos) * proto.step
+        self.estado[proto.id].double_array_value.data[:] = [round(valor, 6)]
+
+
+# ============================
+# ROTEIRO DE USO
+# ============================
+def roteiro(sessao, rng):
+    """Gera as ações de um usuário típico. Cada item é (nome, ação ou None).
+
+    Ação ``None`` representa interação só no navegador (troca de aba), que
+    não dispara rerun e conta apenas como tempo de leitura.
+    """
+    yield "abrir_iqe", lambda: sessao.escolher_opcao(LABEL_MENU, OPCAO_MENU_IQE)
+    while True:
+        yield "municipio", lambda: sessao.escolher_opcao(LABEL_MUNICIPIO, rng=rng)
+        yield "trocar_aba", None
+        yield "radar_tipo", lambda: sessao.alternar_opcao(LABEL_RADAR)
+        yield "radar_tipo", lambda: sessao.alternar_opcao(LABEL_RADAR)
+        yield "trocar_aba", None
+        for label in rng.sample(LABELS_SLIDERS, rng.randint(1, len(LABELS_SLIDERS))):
+            yield "slider", lambda label=label: sessao.mover_slider(label, rng=rng)
+
+
+async def medir_rerun(sessao, nome, medicoes):
+    try:
+        medicoes.append((nome, await sessao.rerun(), None))
+    except ErroApp as exc:  # o app seguiu de pé; a sessão continua o roteiro
+        medicoes.append(("erro", np.nan, f"{nome}: {exc}"))
+
+
+async def executar_sessao(url, fim, pensar, rng, medicoes):
+    sessao = SessaoSimulada(url)
+    try:
+        await sessao.conectar()
+        await medir_rerun(sessao, "carga_inicial", medicoes)
+        for nome, acao in roteiro(sessao, rng):
+            if time.monotonic() >= fim:
+                break
+            await asyncio.sleep(rng.expovariate(1 / pensar) if pensar > 0 else 0)
+            if acao is None:
+                continue
+            acao()
+            await medir_rerun(sessao, nome, medicoes)
+    except Exception as exc:  # registra a falha e segue com as demais sessões
+        medicoes.append(("erro", np.nan, f"{type(exc).__name__}: {exc}"))
+    finally:
+        sessao.fechar()
+
+
+async def executar_etapa(url, monitor, n_sessoes, duracao, pensar, seed):
+    medicoes = []
+    fim = time.monotonic() + duracao
+    # RSS no início da etapa: o CPython raramente devolve memória ao sistema,
+    # então comparar com o aquecimento somaria o crescimento das etapas anteriores
+    rss_base = monitor.rss() if monitor else np.nan
+    if monitor:
+        monitor.iniciar()
+    inicio = time.monotonic()
+    await asyncio.gather(*[
+        executar_sessao(url, fim, pensar, random.Random(seed * 1000 + i), medicoes)
+        for i in range(n_sessoes)
+    ])
+    tempo = time.monotonic() - inicio
+    cpu, rss = await monitor.parar() if monitor else (np.nan, np.nan)
+    return medicoes, tempo, cpu, rss, rss_base
+
+
+def resumir(n_sessoes, medicoes, tempo, cpu, rss, rss_base):
+    """Resume uma etapa. ``rss_mb_por_sessao`` é só o crescimento aproximado
+    por sessão: o alocador reaproveita memória liberada em etapas anteriores e
+    sessões desconectadas ainda podem estar na linha de base."""
+    lat = np.array([m[1] for m in medicoes if m[0] not in ("erro", "carga_inicial")]) * 1000
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (np.nan,) * 3
+    return {
+        "sessoes": n_sessoes,
+        "reruns": len(lat),
+        "erros": sum(1 for m in medicoes if m[0] == "erro"),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "reruns_por_s": len(lat) / tempo if tempo else np.nan,
+        "cpu_pct": cpu,
+        "rss_mb": rss / 2**20,
+        "rss_mb_por_sessao": (rss - rss_base) / 2**20 / n_sessoes,
+    }
+
+
+# ============================
+# CURVA DE CAPACIDADE
+# ============================
+def gravar_resultados(saida, linhas, brutas):
+    cap = pd.DataFrame(linhas)
+    cap.to_csv(saida / "capacidade.csv", index=False)
+    pd.DataFrame(brutas, columns=["sessoes", "acao", "latencia_ms", "erro"]).to_csv(
+        saida / "latencias.csv", index=False)
+    grafico_capacidade(cap).write_html(saida / "curva_capacidade.html", include_plotlyjs="cdn")
+    return cap
+
+
+def grafico_capacidade(cap):
+    fig = go.Figure()
+    for col, cor in [("p50_ms", "#C2A4CF"), ("p95_ms", "#7A3E9D"), ("p99_ms", "#3A0057")]:
+        fig.add_trace(go.Scatter(x=cap["sessoes"], y=cap[col], name=col.replace("_ms", ""),
+                                 mode="lines+markers", line=dict(color=cor, width=3)))
+    fig.add_trace(go.Bar(x=cap["sessoes"], y=cap["cpu_pct"], name="CPU (%)", yaxis="y2",
+                         marker_color="#E5D9EF", opacity=0.6))
+    fig.update_layout(
+        title="Painel IQE – Curva de capacidade (latência de rerun × sessões simultâneas)",
+        xaxis=dict(title="Sessões simultâneas", type="log"),
+        yaxis=dict(title="Latência de rerun (ms)"),
+        yaxis2=dict(title="CPU do servidor (%)", overlaying="y", side="right"),
+        height=520,
+        template="simple_white",
+        font=dict(family="Montserrat", size=12, color="#3A0057")
+    )
+    return fig
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default=str(APP_PADRAO), help="script Streamlit a testar")
+    parser.add_argument("--url", help="usar um servidor já em execução (ex.: http://localhost:8501)")
+    parser.add_argument("--sessoes", default="1,2,4,8,16",
+                        help="quantidades de sessões simultâneas, separadas por vírgula")
+    parser.add_argument("--duracao", type=float, default=60,
+                        help="duração de cada etapa, em segundos")
+    parser.add_argument("--pensar", type=float, default=1.0,
+                        help="tempo médio de leitura entre interações, em segundos")
+    parser.add_argument("--saida", default=str(RAIZ / "resultados_carga"), help="pasta de saída")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--limite-p95", type=float,
+                        help="falha (código 1) se o p95 de alguma etapa passar deste valor (ms);"
+                             " erros em qualquer etapa também resultam em código 1")
+    args = parser.parse_args(argv)
+
+    try:
+        niveis = [int(n) for n in args.sessoes.split(",") if n.strip()]
+    except ValueError:
+        parser.error(f"--sessoes inválido: {args.sessoes!r}")
+    if not niveis or min(niveis) < 1:
+        parser.error("--sessoes precisa de quantidades inteiras maiores ou iguais a 1")
+    saida = Path(args.saida)
+    saida.mkdir(parents=True, exist_ok=True)
+
+    proc = log = None
+    if args.url:
+        base_http = args.url.rstrip("/")
+        monitor_pid = None
+    else:
+        porta = porta_livre()
+        log = open(saida / "servidor.log", "w")
+        try:
+            proc = iniciar_servidor(args.app, porta, log)
+        except RuntimeError:
+            log.close()
+            raise
+        base_http = f"http://127.0.0.1:{porta}"
+        monitor_pid = proc.pid
+    url_ws = base_http.replace("http", "ws", 1) + "/_stcore/stream"
+
+    async def rodar():
+        monitor = MonitorProcesso(monitor_pid) if monitor_pid else None
+        # Aquecimento: preenche o st.cache_data para não medir a leitura da planilha
+        aquecimento = []
+        await executar_sessao(url_ws, time.monotonic() + 5, 0, random.Random(args.seed), aquecimento)
+        falhas = [e for a, _, e in aquecimento if a == "erro"]
+        if falhas:
+            dica = f" (veja {log.name})" if log else ""
+            raise SystemExit(f"Aquecimento falhou{dica}: {falhas[0]}")
+
+        for n in niveis:
+            medicoes, tempo, cpu, rss, rss_base = await executar_etapa(
+                url_ws, monitor, n, args.duracao, args.pensar, args.seed)
+            linha = resumir(n, medicoes, tempo, cpu, rss, rss_base)
+            linhas.append(linha)
+            brutas.extend({"sessoes": n, "acao": a, "latencia_ms": l * 1000, "erro": e}
+                          for a, l, e in medicoes)
+            gravar_resultados(saida, linhas, brutas)
+            print(f"{n:>4} sessões | p50 {linha['p50_ms']:8.1f} ms | p95 {linha['p95_ms']:8.1f} ms"
+                  f" | p99 {linha['p99_ms']:8.1f} ms | {linha['reruns_por_s']:6.2f} reruns/s"
+                  f" | CPU {linha['cpu_pct']:6.1f}% | RSS {linha['rss_mb']:7.1f} MB"
+                  f" | erros {linha['erros']}", flush=True)
+
+    linhas, brutas = [], []
+    try:
+        asyncio.run(rodar())
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        if log is not None:
+            log.close()
+        if linhas:
+            print(f"Resultados gravados em {saida.resolve()}")
+
+    cap = pd.DataFrame(linhas)
+
+    if args.limite_p95 is not None and (cap["p95_ms"] > args.limite_p95).any():
+        print(f"p95 acima do limite de {args.limite_p95:.0f} ms", file=sys.stderr)
+        return 1
+    if cap["erros"].sum():
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())